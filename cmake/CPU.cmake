@@ -21,13 +21,17 @@ IF (NOT C_AVX512_FOUND AND NOT CXX_AVX512_FOUND)
   message(FATAL_ERROR "Please build IPEX on Machines that support AVX512.")
 ENDIF()
 
-# Define build type
+# Define build type flags per config, so multi-config generators (Ninja
+# Multi-Config) select the right set at build time instead of baking one
+# config's flags into the config-agnostic CMAKE_CXX_FLAGS.
+set(CMAKE_CXX_FLAGS_DEBUG "${CMAKE_CXX_FLAGS_DEBUG} -O0 -g -D_DEBUG")
+set(CMAKE_CXX_FLAGS_RELEASE "${CMAKE_CXX_FLAGS_RELEASE} -O2 -DNDEBUG")
 IF(CMAKE_BUILD_TYPE MATCHES Debug)
   message("Debug build.")
-  set(CMAKE_CXX_FLAGS "${CMAKE_CXX_FLAGS} -O0 -g -D_DEBUG")
-ELSE()
+ELSEIF(CMAKE_BUILD_TYPE)
   message("Release build.")
-  set(CMAKE_CXX_FLAGS "${CMAKE_CXX_FLAGS} -O2 -DNDEBUG")
+ELSE()
+  message("Multi-config build.")
 ENDIF()
 
 IF("${IPEX_DISP_OP}" STREQUAL "1")
@@ -9,16 +9,19 @@ except ImportError as e:
     print('You need to install pytorch first.')
     sys.exit(1)
 
-from subprocess import check_call, check_output
+from subprocess import check_output
 from setuptools import setup, Extension, find_packages, distutils
 from setuptools.command.build_ext import build_ext
+from setuptools.command.build_py import build_py
 from distutils.spawn import find_executable
 from distutils.version import LooseVersion
 from sysconfig import get_paths
 
 import distutils.ccompiler
 import distutils.command.clean
+import functools
 import glob
+import hashlib
 import inspect
 import multiprocessing
 import multiprocessing.pool
@@ -26,6 +29,7 @@ import os
 import platform
 import re
 import shutil
+import signal
 import subprocess
 import sys
 
@@ -47,22 +51,23 @@ def which(thefile):
                 return name
     return None
 
+def get_cmake_version(cmd):
+    for line in check_output([cmd, '--version']).decode('utf-8').split('\n'):
+        if 'version' in line:
+            return LooseVersion(line.strip().split(' ')[2])
+    raise RuntimeError('no version found')
+
 def get_cmake_command():
-    def _get_version(cmd):
-        for line in check_output([cmd, '--version']).decode('utf-8').split('\n'):
-            if 'version' in line:
-                return LooseVersion(line.strip().split(' ')[2])
-        raise RuntimeError('no version found')
     "Returns cmake command."
     cmake_command = 'cmake'
     if platform.system() == 'Windows':
         return cmake_command
     cmake3 = which('cmake3')
     cmake = which('cmake')
-    if cmake3 is not None and _get_version(cmake3) >= LooseVersion("3.13.0"):
+    if cmake3 is not None and get_cmake_version(cmake3) >= LooseVersion("3.13.0"):
         cmake_command = 'cmake3'
         return cmake_command
-    elif cmake is not None and _get_version(cmake) >= LooseVersion("3.13.0"):
+    elif cmake is not None and get_cmake_version(cmake) >= LooseVersion("3.13.0"):
          return cmake_command
     else:
          raise RuntimeError('no cmake or cmake3 with version >= 3.13.0 found')
@@ -71,6 +76,70 @@ def _check_env_flag(name, default=''):
   return os.getenv(name, default).upper() in ['ON', '1', 'YES', 'TRUE', 'Y']
 
 
+def _run_build_command(command, cwd, env):
+  # Run the command in its own session so an interrupted build can kill the
+  # whole process group; otherwise parallel make/ninja workers keep running
+  # (and holding lock files) after Ctrl-C.
+  process = subprocess.Popen(command, cwd=cwd, env=env, start_new_session=True)
+  try:
+    returncode = process.wait()
+  except KeyboardInterrupt:
+    try:
+      os.killpg(os.getpgid(process.pid), signal.SIGINT)
+    except OSError:
+      pass
+    process.wait()
+    raise
+  if returncode != 0:
+    raise subprocess.CalledProcessError(returncode, command)
+
+
+def _maybe_redirect_build_dir_to_tmpfs(build_dir):
+  # Opt-in via IPEX_BUILD_ON_TMPFS: keep the object files on /dev/shm so
+  # write-heavy compile output hits RAM instead of disk.  The symlink is
+  # left in place across runs so incremental state persists.  Must run
+  # before anything (codegen stamps included) creates the build directory.
+  if not _check_env_flag('IPEX_BUILD_ON_TMPFS'):
+    return
+  if os.path.islink(build_dir):
+    # A reboot wipes /dev/shm; re-create the target rather than letting a
+    # dangling link fail the later makedirs.  If tmpfs is gone entirely,
+    # drop the link and fall back to an on-disk build directory.
+    try:
+      os.makedirs(os.readlink(build_dir), exist_ok=True)
+    except OSError:
+      os.unlink(build_dir)
+    return
+  if os.path.isdir(build_dir):
+    if os.listdir(build_dir):
+      # Never displace an existing build tree.
+      return
+    os.rmdir(build_dir)
+  elif os.path.exists(build_dir):
+    return
+  tmpfs_root = '/dev/shm'
+  try:
+    stats = os.statvfs(tmpfs_root)
+  except OSError:
+    return
+  if stats.f_bavail * stats.f_frsize < 8 * 1024 ** 3:
+    return
+  tmpfs_build_dir = os.path.join(
+      tmpfs_root, 'ipex_build',
+      hashlib.sha256(build_dir.encode('utf-8')).hexdigest()[:16])
+  os.makedirs(tmpfs_build_dir, exist_ok=True)
+  os.symlink(tmpfs_build_dir, build_dir)
+
+
+def _effective_cpu_count():
+  # Unlike multiprocessing.cpu_count(), the affinity mask respects cpuset
+  # cgroups, so containerized builds do not oversubscribe the host.
+  if hasattr(os, 'sched_getaffinity'):
+    return len(os.sched_getaffinity(0))
+  return multiprocessing.cpu_count()
+
+
+@functools.lru_cache(maxsize=None)
 def _get_env_backend():
   env_backend_var_name = 'IPEX_BACKEND'
   env_backend_options = ['cpu', 'gpu']
@@ -85,19 +154,60 @@ def _get_env_backend():
       return env_backend_val
 
 
+def _read_head_sha(repo_dir):
+  # Read HEAD straight out of .git instead of forking `git rev-parse`.
+  git_dir = os.path.join(repo_dir, '.git')
+  with open(os.path.join(git_dir, 'HEAD'), 'r') as f:
+    head = f.read().strip()
+  if not head.startswith('ref:'):
+    return head
+  ref = head.split(' ', 1)[1].strip()
+  ref_path = os.path.join(git_dir, *ref.split('/'))
+  if os.path.isfile(ref_path):
+    with open(ref_path, 'r') as f:
+      return f.read().strip()
+  with open(os.path.join(git_dir, 'packed-refs'), 'r') as f:
+    for line in f:
+      line = line.strip()
+      if not line or line.startswith('#') or line.startswith('^'):
+        continue
+      sha, _, name = line.partition(' ')
+      if name == ref:
+        return sha
+  raise RuntimeError("'{}' not found in packed-refs".format(ref))
+
+
+def _get_repo_sha(repo_dir):
+  try:
+    return _read_head_sha(repo_dir)
+  except (OSError, RuntimeError):
+    pass
+  try:
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                   cwd=repo_dir).decode('ascii').strip()
+  except (OSError, subprocess.CalledProcessError):
+    # Source tarballs ship without .git; use the pre-baked GITREV file
+    # when one exists.
+    gitrev_path = os.path.join(repo_dir, 'GITREV')
+    if os.path.isfile(gitrev_path):
+      with open(gitrev_path, 'r') as f:
+        return f.read().strip()
+    return ''
+
+
+# Memoized: pip's build isolation re-imports setup.py several times per
+# install, and the answers cannot change within one invocation.
+@functools.lru_cache(maxsize=None)
 def get_git_head_sha(base_dir):
-  ipex_git_sha = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
-                                        cwd=base_dir).decode('ascii').strip()
+  ipex_git_sha = _get_repo_sha(base_dir)
   if os.path.isdir(os.path.join(base_dir, '..', '.git')):
-    torch_git_sha = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
-                                            cwd=os.path.join(
-                                                base_dir,
-                                                '..')).decode('ascii').strip()
+    torch_git_sha = _get_repo_sha(os.path.join(base_dir, '..'))
   else:
     torch_git_sha = ''
   return ipex_git_sha, torch_git_sha
 
 
+@functools.lru_cache(maxsize=None)
 def get_build_version(ipex_git_sha):
   version = os.getenv('TORCH_IPEX_VERSION', '1.2.0')
   if _check_env_flag('VERSIONED_IPEX_BUILD', default='0'):
@@ -108,46 +218,156 @@ def get_build_version(ipex_git_sha):
   return version
 
 
+def _write_if_changed(path, content):
+  # Leave the file (and its mtime) alone when the content is already up to
+  # date, so unchanged generated files never trigger recompiles.
+  if os.path.isfile(path):
+    with open(path, 'r') as f:
+      if f.read() == content:
+        return
+  with open(path, 'w') as f:
+    f.write(content)
+
+
 def create_version_files(base_dir, version, ipex_git_sha, torch_git_sha):
   print('Building torch_ipex version: {}'.format(version))
   py_version_path = os.path.join(base_dir, 'intel_pytorch_extension_py', 'version.py')
-  with open(py_version_path, 'w') as f:
-    f.write('# Autogenerated file, do not edit!\n')
-    f.write("__version__ = '{}'\n".format(version))
-    f.write("__ipex_gitrev__ = '{}'\n".format(ipex_git_sha))
-    f.write("__torch_gitrev__ = '{}'\n".format(torch_git_sha))
+  py_version_content = '# Autogenerated file, do not edit!\n'
+  py_version_content += "__version__ = '{}'\n".format(version)
+  py_version_content += "__ipex_gitrev__ = '{}'\n".format(ipex_git_sha)
+  py_version_content += "__torch_gitrev__ = '{}'\n".format(torch_git_sha)
+  _write_if_changed(py_version_path, py_version_content)
 
   cpp_version_path = os.path.join(base_dir, 'torch_ipex', 'csrc', 'version.cpp')
-  with open(cpp_version_path, 'w') as f:
-    f.write('// Autogenerated file, do not edit!\n')
-    f.write('#include "torch_ipex/csrc/version.h"\n\n')
-    f.write('namespace torch_ipex {\n\n')
-    f.write('const char IPEX_GITREV[] = {{"{}"}};\n'.format(ipex_git_sha))
-    f.write('const char TORCH_GITREV[] = {{"{}"}};\n\n'.format(torch_git_sha))
-    f.write('}  // namespace torch_ipex\n')
+  cpp_version_content = '// Autogenerated file, do not edit!\n'
+  cpp_version_content += '#include "torch_ipex/csrc/version.h"\n\n'
+  cpp_version_content += 'namespace torch_ipex {\n\n'
+  cpp_version_content += 'const char IPEX_GITREV[] = {{"{}"}};\n'.format(ipex_git_sha)
+  cpp_version_content += 'const char TORCH_GITREV[] = {{"{}"}};\n\n'.format(torch_git_sha)
+  cpp_version_content += '}  // namespace torch_ipex\n'
+  _write_if_changed(cpp_version_path, cpp_version_content)
+
+
+def _codegen_inputs_hash(content_paths, header_dirs=()):
+  # Hash script/spec contents, but only the mtimes of the (large) header
+  # trees; a header change still invalidates the stamp either way.
+  sha = hashlib.sha256()
+  for content_path in content_paths:
+    if os.path.isdir(content_path):
+      for root, dirs, files in os.walk(content_path):
+        dirs.sort()
+        for name in sorted(files):
+          path = os.path.join(root, name)
+          sha.update(path.encode('utf-8'))
+          with open(path, 'rb') as f:
+            sha.update(f.read())
+    elif os.path.isfile(content_path):
+      sha.update(content_path.encode('utf-8'))
+      with open(content_path, 'rb') as f:
+        sha.update(f.read())
+  for header_dir in header_dirs:
+    for root, dirs, files in os.walk(header_dir):
+      dirs.sort()
+      for name in sorted(files):
+        if name.endswith('.h'):
+          path = os.path.join(root, name)
+          sha.update(path.encode('utf-8'))
+          sha.update(str(os.path.getmtime(path)).encode('utf-8'))
+  return sha.hexdigest()
+
+
+def _configure_inputs_hash(project_dir, cmake_args):
+  sha = hashlib.sha256()
+  for cmake_arg in sorted(cmake_args):
+    sha.update(cmake_arg.encode('utf-8'))
+  cmake_files = [os.path.join(project_dir, 'CMakeLists.txt')]
+  cmake_files += sorted(glob.glob(
+      os.path.join(project_dir, 'cmake', '**', '*.cmake'), recursive=True))
+  for cmake_file in cmake_files:
+    if os.path.isfile(cmake_file):
+      sha.update(cmake_file.encode('utf-8'))
+      sha.update(str(os.path.getmtime(cmake_file)).encode('utf-8'))
+  return sha.hexdigest()
+
+
+def _cached_cmake_generator(build_dir):
+  cmake_cache_path = os.path.join(build_dir, 'CMakeCache.txt')
+  if not os.path.isfile(cmake_cache_path):
+    return None
+  with open(cmake_cache_path, 'r') as f:
+    for line in f:
+      if line.startswith('CMAKE_GENERATOR:INTERNAL='):
+        return line.split('=', 1)[1].strip()
+  return None
 
 
 def generate_ipex_cpu_aten_code(base_dir):
+  cpu_ops_path = os.path.join(base_dir, 'torch_ipex', 'csrc', 'cpu')
+  script_dir = os.path.join(base_dir, 'scripts', 'cpu')
+  sparse_dec_file_path = os.path.join(script_dir, 'pytorch_headers')
+  torch_include_dir = os.path.join(pytorch_install_dir, 'include')
+
+  # Each script is gated behind its own input-hash stamp, so a clean tree
+  # skips the codegen (and the output-file touches that would cascade into
+  # recompiles) entirely.
+  generate_code_jobs = [
+      ('.gen_sparse.stamp',
+       ['./gen-sparse-cpu-ops.sh', cpu_ops_path, pytorch_install_dir, sparse_dec_file_path],
+       _codegen_inputs_hash(
+           [os.path.join(script_dir, 'gen-sparse-cpu-ops.sh'),
+            os.path.join(script_dir, 'gen-sparse-cpu-ops.py'),
+            os.path.join(script_dir, 'common'),
+            os.path.join(script_dir, 'sparse_spec'),
+            sparse_dec_file_path],
+           [torch_include_dir])),
+      ('.gen_dense.stamp',
+       ['./gen-dense-cpu-ops.sh', cpu_ops_path, pytorch_install_dir],
+       _codegen_inputs_hash(
+           [os.path.join(script_dir, 'gen-dense-cpu-ops.sh'),
+            os.path.join(script_dir, 'gen-dense-cpu-ops.py'),
+            os.path.join(script_dir, 'common')],
+           [torch_include_dir])),
+  ]
+
+  stamp_dir = os.path.join(base_dir, 'build')
+  stale_jobs = []
+  for stamp_name, generate_code_cmd, inputs_hash in generate_code_jobs:
+    stamp_path = os.path.join(stamp_dir, stamp_name)
+    if os.path.isfile(stamp_path):
+      with open(stamp_path, 'r') as f:
+        if f.read() == inputs_hash:
+          continue
+    stale_jobs.append((stamp_path, generate_code_cmd, inputs_hash))
+
+  if not stale_jobs:
+    return
+
   cur_dir = os.path.abspath(os.path.curdir)
 
-  os.chdir(os.path.join(base_dir, 'scripts', 'cpu'))
+  os.chdir(script_dir)
 
-  cpu_ops_path = os.path.join(base_dir, 'torch_ipex', 'csrc', 'cpu')
-  sparse_dec_file_path = os.path.join(base_dir, 'scripts', 'cpu', 'pytorch_headers')
-  generate_code_cmd = ['./gen-sparse-cpu-ops.sh', cpu_ops_path, pytorch_install_dir, sparse_dec_file_path]
-  if subprocess.call(generate_code_cmd) != 0:
-    print("Failed to run '{}'".format(generate_code_cmd), file=sys.stderr)
-    os.chdir(cur_dir)
-    sys.exit(1)
+  def run_gen_cmd(job):
+    process = subprocess.Popen(job[1])
+    process.communicate()
+    return process.returncode
 
-  generate_code_cmd = ['./gen-dense-cpu-ops.sh', cpu_ops_path, pytorch_install_dir]
-  if subprocess.call(generate_code_cmd) != 0:
-    print("Failed to run '{}'".format(generate_code_cmd), file=sys.stderr)
-    os.chdir(cur_dir)
-    sys.exit(1)
+  # The codegen scripts write disjoint outputs under cpu_ops_path, so
+  # overlap them instead of running them back to back.
+  return_codes = multiprocessing.pool.ThreadPool(len(stale_jobs)).map(
+      run_gen_cmd, stale_jobs)
 
   os.chdir(cur_dir)
 
+  for (stamp_path, generate_code_cmd, inputs_hash), return_code in \
+      zip(stale_jobs, return_codes):
+    if return_code != 0:
+      print("Failed to run '{}'".format(generate_code_cmd), file=sys.stderr)
+      sys.exit(1)
+    if not os.path.isdir(stamp_dir):
+      os.makedirs(stamp_dir)
+    with open(stamp_path, 'w') as f:
+      f.write(inputs_hash)
+
 
 class IPEXExt(Extension, object):
   def __init__(self, name, project_dir=os.path.dirname(__file__)):
@@ -159,8 +379,9 @@ class IPEXExt(Extension, object):
 class IPEXClean(distutils.command.clean.clean, object):
 
   def run(self):
-    import glob
+    import fnmatch
     import re
+    wildcards = []
     with open('.gitignore', 'r') as f:
       ignores = f.read()
       pat = re.compile(r'^#( BEGIN NOT-CLEAN-FILES )?')
@@ -172,20 +393,83 @@ class IPEXClean(distutils.command.clean.clean, object):
             break
           # Ignore lines which begin with '#'.
         else:
-          for filename in glob.glob(wildcard):
-            try:
-              os.remove(filename)
-            except OSError:
-              shutil.rmtree(filename, ignore_errors=True)
+          wildcards.append(wildcard)
+
+    if wildcards:
+      # Match every entry against regex unions in one tree walk instead of
+      # re-statting the tree once per .gitignore pattern.  As in git,
+      # patterns containing a '/' are anchored to the repo root and match
+      # full relative paths; bare patterns match basenames at any depth.
+      anchored = []
+      floating = []
+      for wildcard in wildcards:
+        stripped = wildcard.strip('/')
+        if '/' in stripped or wildcard.startswith('/'):
+          anchored.append(stripped)
+        else:
+          floating.append(stripped)
+      anchored_pat = re.compile('|'.join(
+          fnmatch.translate(wildcard) for wildcard in anchored)) if anchored else None
+      floating_pat = re.compile('|'.join(
+          fnmatch.translate(wildcard) for wildcard in floating)) if floating else None
+
+      def matches(path, name):
+        if anchored_pat is not None and anchored_pat.match(path):
+          return True
+        return floating_pat is not None and floating_pat.match(name)
+
+      # Never descend into version control state or vendored trees.
+      prune_dirs = {'.git', 'third_party'}
+      matched_files = []
+      matched_dirs = []
+      for root, dirs, files in os.walk('.'):
+        dirs[:] = [name for name in dirs if name not in prune_dirs]
+        for name in list(dirs):
+          path = os.path.relpath(os.path.join(root, name))
+          if matches(path, name):
+            matched_dirs.append(path)
+            dirs.remove(name)
+        for name in files:
+          path = os.path.relpath(os.path.join(root, name))
+          if matches(path, name):
+            matched_files.append(path)
+      for filename in matched_files:
+        try:
+          os.unlink(filename)
+        except OSError:
+          pass
+      for dirname in matched_dirs:
+        shutil.rmtree(dirname, ignore_errors=True)
 
     # It's an old-style class in Python 2.7...
     distutils.command.clean.clean.run(self)
 
 
+class IPEXBuildPy(build_py, object):
+
+  def run(self):
+    # version.py is generated, not tracked, and build_py runs before
+    # build_ext, so it must be written here or a fresh clone ships a
+    # package whose `from .version import __version__` fails.
+    create_version_files(base_dir, version, ipex_git_sha, torch_git_sha)
+    build_py.run(self)
+
+
 class IPEXBuild(build_ext, object):
   def run(self):
     print("run")
 
+    # Redirect build directories first: generate_ipex_cpu_aten_code and the
+    # configure step below both write into them.
+    for ext in self.extensions:
+      _maybe_redirect_build_dir_to_tmpfs(ext.build_dir)
+
+    # Generate version info (torch_ipex.__version__).  Done lazily (here
+    # and in IPEXBuildPy) rather than at import time so pure metadata
+    # probes (egg_info, --name) do not touch generated files; repeated here
+    # to cover direct `setup.py build_ext` invocations.
+    create_version_files(base_dir, version, ipex_git_sha, torch_git_sha)
+
     # Generate the code before globbing!
     generate_ipex_cpu_aten_code(base_dir)
 
@@ -200,26 +484,47 @@ class IPEXBuild(build_ext, object):
     if platform.system() == "Windows":
       raise RuntimeError("Does not support windows")
 
+    self.cmake_version = get_cmake_version(cmake)
+
     for ext in self.extensions:
       self.build_extension(ext)
 
   def build_extension(self, ext):
     ext_dir = os.path.abspath(os.path.dirname(self.get_ext_fullpath(ext.name)))
-    if not os.path.exists(ext.build_dir):
-      os.mkdir(ext.build_dir)
+    os.makedirs(ext.build_dir, exist_ok=True)
+
+    # Read each env flag once up front; _check_env_flag walks the
+    # environment on every call.
+    use_sycl = _check_env_flag("USE_SYCL")
+    use_make = _check_env_flag("USE_MAKE")
+    use_ninja_env = _check_env_flag("USE_NINJA")
+    debug = _check_env_flag("DEBUG")
+    ipex_disp_op = _check_env_flag("IPEX_DISP_OP")
+    ipex_profile_op = _check_env_flag("IPEX_PROFILE_OP")
+    dpcpp_enable_profiling = _check_env_flag("DPCPP_ENABLE_PROFILING")
 
     build_type = 'Release'
-    use_ninja = False
 
-    if _check_env_flag('DEBUG'):
+    if debug:
       build_type = 'Debug'
 
+    # Prefer the Ninja generator whenever it is available: it parallelizes
+    # better than Make and re-stats incrementally on rebuilds.  USE_MAKE
+    # forces the Make generator back on.
+    use_ninja = not use_make and (
+        use_ninja_env or find_executable('ninja') is not None)
+    # With a recent CMake, use Ninja Multi-Config so alternating Debug and
+    # Release builds share one configure instead of invalidating CMakeCache
+    # whenever the build type flips; --config picks the flavor at build time.
+    multi_config = use_ninja and self.cmake_version >= LooseVersion('3.17.0')
+
     # install _torch_ipex.so as python module
-    if ext.name == 'torch_ipex' and _check_env_flag("USE_SYCL"):
+    if ext.name == 'torch_ipex' and use_sycl:
       ext_dir = ext_dir + '/torch_ipex'
+    # CMake expects the install prefix to exist.
+    os.makedirs(ext_dir, exist_ok=True)
 
     cmake_args = [
-            '-DCMAKE_BUILD_TYPE=' + build_type,
             '-DPYTORCH_INSTALL_DIR=' + pytorch_install_dir,
             '-DPYTHON_EXECUTABLE=' + sys.executable,
             '-DCMAKE_INSTALL_PREFIX=' + ext_dir,
@@ -228,46 +533,130 @@ class IPEXBuild(build_ext, object):
             '-DPYTHON_INCLUDE_DIR=' + python_include_dir,
             '-DPYTORCH_INCLUDE_DIRS=' + pytorch_install_dir + "/include",
             '-DPYTORCH_LIBRARY_DIRS=' + pytorch_install_dir + "/lib",
+            # compile_commands.json feeds clangd and sccache's direct mode.
+            '-DCMAKE_EXPORT_COMPILE_COMMANDS=ON',
         ]
 
-    if _check_env_flag("IPEX_DISP_OP"):
+    if multi_config:
+      cmake_args += ['-G', 'Ninja Multi-Config']
+    else:
+      cmake_args += ['-DCMAKE_BUILD_TYPE=' + build_type]
+      if use_ninja:
+        cmake_args += ['-GNinja']
+
+    if ipex_disp_op:
       cmake_args += ['-DIPEX_DISP_OP=1']
 
-    if _check_env_flag("IPEX_PROFILE_OP"):
+    if ipex_profile_op:
       cmake_args += ['-DIPEX_PROFILE_OP=1']
 
-    if _check_env_flag("USE_SYCL"):
+    if use_sycl:
       cmake_args += ['-DUSE_SYCL=1']
 
-    if _check_env_flag("DPCPP_ENABLE_PROFILING"):
+    if dpcpp_enable_profiling:
       cmake_args += ['-DDPCPP_ENABLE_PROFILING=1']
 
-    if _check_env_flag("USE_NINJA"):
-      use_ninja = True
-      cmake_args += ['-GNinja']
-
-    build_args = ['-j', str(multiprocessing.cpu_count())]
+    # IPO restores inlining across the per-op translation units that the
+    # codegen scripts split the ATen kernels into.  The project's
+    # cmake_minimum_required(3.5) leaves policy CMP0069 OLD, under which
+    # CMake silently ignores INTERPROCEDURAL_OPTIMIZATION for GCC/Clang,
+    # so force it to NEW here.  Under a multi-config
+    # generator use the config-scoped variable so cmake_args are identical
+    # for Debug and Release and flipping DEBUG does not reconfigure; under
+    # a single-config generator pass an explicit OFF for Debug, since the
+    # cached ON from an earlier Release configure is sticky.
+    cmake_args += ['-DCMAKE_POLICY_DEFAULT_CMP0069=NEW']
+    if multi_config:
+      cmake_args += ['-DCMAKE_INTERPROCEDURAL_OPTIMIZATION_RELEASE=ON']
+    else:
+      cmake_args += ['-DCMAKE_INTERPROCEDURAL_OPTIMIZATION='
+                     + ('ON' if build_type == 'Release' else 'OFF')]
+
+    # IPEX_PGO=generate instruments the build; IPEX_PGO=use feeds the
+    # collected profiles back into a second build.  CMAKE_CXX_FLAGS is
+    # always passed so a cached profile flag from an earlier configure
+    # cannot stick around; it is seeded from $CXXFLAGS, which CMake stops
+    # honoring once the cache variable is set explicitly.
+    pgo_mode = os.getenv('IPEX_PGO', '').strip().lower()
+    cxx_flags = os.environ.get('CXXFLAGS', '')
+    if pgo_mode in ('generate', 'use'):
+      pgo_dir = os.path.join(ext.build_dir, 'pgo')
+      cxx_flags = ' '.join(filter(None, [
+          cxx_flags, '-fprofile-{}={}'.format(pgo_mode, pgo_dir)]))
+    cmake_args += ['-DCMAKE_CXX_FLAGS=' + cxx_flags]
+
+    # Route compiles through a compiler cache when one is installed, so
+    # rebuilds only pay for translation units whose inputs actually changed.
+    compiler_launcher = find_executable('sccache') or find_executable('ccache')
+    if compiler_launcher is not None:
+      cmake_args += [
+              '-DCMAKE_C_COMPILER_LAUNCHER=' + compiler_launcher,
+              '-DCMAKE_CXX_COMPILER_LAUNCHER=' + compiler_launcher,
+          ]
+
+    # Over-subscribe the job count slightly so compile jobs can overlap with
+    # link/archive jobs that sleep on I/O.  MAX_JOBS overrides the count for
+    # memory-constrained CI boxes.
+    max_jobs = os.getenv('MAX_JOBS')
+    job_count = int(max_jobs) if max_jobs else _effective_cpu_count() + 2
+    build_args = [
+            '--build', '.',
+            '--parallel', str(job_count),
+            '--config', build_type,
+            '--target', 'install',
+        ]
 
     env = os.environ.copy()
-    if _check_env_flag("USE_SYCL"):
+    # CMAKE_BUILD_PARALLEL_LEVEL is read from the environment (it is not a
+    # cache variable); it provides the default parallelism for any nested
+    # `cmake --build` invocation that is not passed --parallel explicitly.
+    # Kept out of cmake_args so the machine-dependent value does not churn
+    # the configure hash.
+    env.setdefault('CMAKE_BUILD_PARALLEL_LEVEL', str(job_count))
+    if compiler_launcher is not None and os.path.basename(compiler_launcher) == 'ccache':
+      # Keep the cache next to the build tree so each extension gets its own.
+      env.setdefault('CCACHE_DIR', os.path.join(ext.build_dir, '.ccache'))
+    if use_sycl:
       os.environ['CXX'] = 'compute++'
-      check_call([self.cmake, ext.project_dir] + cmake_args, cwd=ext.build_dir, env=env)
-    else:
-      check_call([self.cmake, ext.project_dir] + cmake_args, cwd=ext.build_dir, env=env)
 
-    # build_args += ['VERBOSE=1']
-    if use_ninja:
-      check_call(['ninja'] + build_args, cwd=ext.build_dir, env=env)
+    # CMake hard-errors when an existing cache was written by a different
+    # generator ("does not match the generator used previously"), which
+    # would strand every pre-Ninja-default checkout.  Drop the stale cache
+    # so the switch just reconfigures, as pytorch's own setup helpers do.
+    if multi_config:
+      generator = 'Ninja Multi-Config'
+    elif use_ninja:
+      generator = 'Ninja'
     else:
-      check_call(['make'] + build_args, cwd=ext.build_dir, env=env)
-    check_call(['make', 'install'] + build_args, cwd=ext.build_dir, env=env)
+      generator = 'Unix Makefiles'
+    cached_generator = _cached_cmake_generator(ext.build_dir)
+    if cached_generator is not None and cached_generator != generator:
+      os.remove(os.path.join(ext.build_dir, 'CMakeCache.txt'))
+      shutil.rmtree(os.path.join(ext.build_dir, 'CMakeFiles'), ignore_errors=True)
+
+    # Re-running configure is pure overhead when neither cmake_args nor any
+    # CMake source changed; the generated build files re-run CMake on their
+    # own when CMakeLists.txt changes.
+    configure_hash = _configure_inputs_hash(ext.project_dir, cmake_args)
+    configure_hash_path = os.path.join(ext.build_dir, '.cmake_args.hash')
+    need_configure = True
+    if os.path.isfile(os.path.join(ext.build_dir, 'CMakeCache.txt')) and \
+        os.path.isfile(configure_hash_path):
+      with open(configure_hash_path, 'r') as f:
+        need_configure = f.read() != configure_hash
+    if need_configure:
+      _run_build_command([self.cmake, ext.project_dir] + cmake_args, cwd=ext.build_dir, env=env)
+      with open(configure_hash_path, 'w') as f:
+        f.write(configure_hash)
+
+    # `cmake --build` maps --parallel onto the right invocation for the
+    # generator in use and folds the install step into the same run, so no
+    # generator-specific branch is needed here.
+    _run_build_command([self.cmake] + build_args, cwd=ext.build_dir, env=env)
 
 ipex_git_sha, torch_git_sha = get_git_head_sha(base_dir)
 version = get_build_version(ipex_git_sha)
 
-# Generate version info (torch_xla.__version__)
-create_version_files(base_dir, version, ipex_git_sha, torch_git_sha)
-
 
 # Constant known variables used throughout this file
 
@@ -285,23 +674,31 @@ def make_relative_rpath(path):
   else:
     return '-Wl,-rpath,$ORIGIN/' + path
 
+# Discover packages once instead of hand-listing every submodule.
+# torch_ipex is the install target for the extension library rather than a
+# source tree with an __init__.py, so it stays explicit; the packages found
+# under the on-disk intel_pytorch_extension_py name are re-rooted to the
+# intel_pytorch_extension import name to match package_dir below.
+PACKAGES = ['torch_ipex']
+PACKAGES += [
+    'intel_pytorch_extension' + name[len('intel_pytorch_extension_py'):]
+    for name in find_packages(
+        include=['intel_pytorch_extension_py*'],
+        exclude=['build*', 'scripts*', 'tests*'])
+]
+
 setup(
     name='torch_ipex',
     version=version,
     description='Intel PyTorch Extension',
     url='https://github.com/intel/intel-extension-for-pytorch',
     author='Intel/PyTorch Dev Team',
-    # Exclude the build files.
-    #packages=find_packages(exclude=['build']),
-    packages=[
-      'torch_ipex',
-      'intel_pytorch_extension',
-      'intel_pytorch_extension.optim',
-      'intel_pytorch_extension.ops'],
+    packages=PACKAGES,
     package_dir={'intel_pytorch_extension': 'intel_pytorch_extension_py'},
     zip_safe=False,
     ext_modules=[IPEXExt('_torch_ipex')],
     cmdclass={
+        'build_py': IPEXBuildPy,
         'build_ext': IPEXBuild,
         'clean': IPEXClean,
     })